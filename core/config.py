@@ -6,6 +6,12 @@ import os
 import yaml
 from typing import Any, Dict, Optional
 
+try:
+    # Use the libyaml based loader when available
+    from yaml import CSafeLoader as YamlLoader
+except ImportError:
+    from yaml import SafeLoader as YamlLoader
+
 
 
 _dir: str
@@ -4,8 +4,14 @@
 """
 
 import time
-import json
 import asyncio
+import logging
+
+try:
+    # orjson is considerably faster for the high rate tracking messages
+    from orjson import loads as json_loads
+except ImportError:
+    from json import loads as json_loads
 
 import aiormq.abc
 
@@ -25,6 +31,9 @@ class Rotator(BaseModule):
     # affects how often hardware functions are called
     position_update_interval = 1.0
 
+    # routing keys handled by tracking_event
+    TRACKING_EVENTS = frozenset(("target.position", "preaos", "aos", "los"))
+
     def __init__(self, driver, address, tracking_enabled=False, **kwarg):
         """
         Initialize rotator module
@@ -60,7 +69,32 @@ class Rotator(BaseModule):
 
         # most recent received position received from hardware
         self.current_position = (0, 0)
-        self.position_timestamp = time.time()  # timestamp for most recent position
+        self.position_timestamp = time.monotonic()  # timestamp for most recent position
+        # time after which the position must be polled again from the hardware
+        self._position_expiry = self.position_timestamp + self.position_update_interval
+
+        # Set when the state changes so that the state loop reacts immediately
+        self._wake = asyncio.Event()
+
+        # Latest tracking target received but not yet applied by check_state
+        self._pending_target = None
+
+        # Calibration history log, opened on the first calibration
+        self._cal_history = None
+
+        # RPC request name to handler method
+        self._rpc_table = {
+            "rpc.tracking": self._rpc_tracking,
+            "rpc.rotate": self._rpc_rotate,
+            "rpc.stop": self._rpc_stop,
+            "rpc.calibrate": self._rpc_calibrate,
+            "rpc.get_position_target": self._rpc_get_position_target,
+            "rpc.get_position_range": self._rpc_get_position_range,
+            "rpc.set_position_range": self._rpc_set_position_range,
+            "rpc.get_dutycycle_range": self._rpc_get_dutycycle_range,
+            "rpc.set_dutycycle_range": self._rpc_set_dutycycle_range,
+            "rpc.get_status": self._rpc_get_status,
+        }
 
         # Connect to rotator controller box
         # Sets up connection to the controller box
@@ -89,40 +123,59 @@ class Rotator(BaseModule):
 
         while True:
             await self.check_state()
-            await asyncio.sleep(1 if self.moving_to_target else 2)
+
+            # Sleep until next periodic update or until woken up by new command
+            try:
+                await asyncio.wait_for(self._wake.wait(),
+                                       timeout=1 if self.moving_to_target else 2)
+            except asyncio.TimeoutError:
+                pass
+            self._wake.clear()
 
 
-    def refresh_rotator_position(self, force_update=False):
+    def refresh_rotator_position(self, force_update=False, now=None):
         """
             returns latest rotator position.
             If position information is fresh and recent enough it returns just
             last known value to avoid slowing down hardware interface too much
             (hardware is SLO-OW down there).
             Can be forced to poll new position with "force_update".
+            `now` is the current monotonic time if already known by the caller.
         """
 
+        # Called on every tick, so skip building debug log arguments when not needed
+        debug = self.log.isEnabledFor(logging.DEBUG)
+        if now is None:
+            now = time.monotonic()
+
         # check if position information can be considered too old
-        if time.time() < self.position_timestamp + self.position_update_interval and not force_update:
-            self.log.debug("No update! Ellapsed time %f",
-                           time.time() - self.position_timestamp)
+        if now < self._position_expiry and not force_update:
+            if debug:
+                self.log.debug("No update! Ellapsed time %f",
+                               now - self.position_timestamp)
             return
 
         try:
             # record timestamp for new position
             self.current_position = self.rotator.get_position()
-            self.position_timestamp = time.time()
+            self.position_timestamp = now
+            self._position_expiry = now + self.position_update_interval
 
-            self.log.debug("pos now %f %f", *self.current_position)
+            if debug:
+                self.log.debug("pos now %f %f", *self.current_position)
 
         except ControllerBoxError as e:
             self.log.error("Could not get rotator position: %s", e, exc_info=True)
             return
 
 
-    def get_status_msg(self):
+    def get_status_msg(self, now=None):
         """
         Create rotator status information frame
 
+        Args:
+            now: Current monotonic time if already known by the caller
+
         Returns:
             dict containing following fields:
             - `az`: Current azimuth angle
@@ -133,7 +186,10 @@ class Rotator(BaseModule):
             - `rotating`: Is the rotator currently moving
         """
 
-        if time.time() - self.position_timestamp > 60:
+        if now is None:
+            now = time.monotonic()
+
+        if now - self.position_timestamp > 60:
             status = "timeout"
         else:
             status = "tracking" if self.tracking_enabled else "manual"
@@ -159,7 +215,13 @@ class Rotator(BaseModule):
         safe update speed.
         """
 
-        self.refresh_rotator_position()
+        # Apply only the most recent tracking target received since last tick
+        if self._pending_target is not None:
+            self.set_target_position(self._pending_target, shortest_path=True)
+            self._wake.clear()  # Handled right now
+
+        now = time.monotonic()
+        self.refresh_rotator_position(now=now)
 
         # Check what we are doing atm and has anything changed
         if self.target_valid:
@@ -201,7 +263,14 @@ class Rotator(BaseModule):
             # still waiting for new target coordinates, do nothing
             pass
 
-        await self.publish(self.get_status_msg(),
+        await self._publish_status_now(now)
+
+
+    async def _publish_status_now(self, now=None):
+        """
+        Publish the rotator status message without polling the hardware
+        """
+        await self.publish(self.get_status_msg(now),
             exchange="rotator",
             routing_key="status",
             prefixed=True)
@@ -215,8 +284,8 @@ class Rotator(BaseModule):
         Returns True if antenna is pointing to target within limits.
         """
 
-        return abs(self.current_position[0] - self.target_position[0]) <= accuracy and \
-               abs(self.current_position[1] - self.target_position[1]) <= accuracy
+        current, target = self.current_position, self.target_position
+        return max(abs(current[0] - target[0]), abs(current[1] - target[1])) <= accuracy
 
 
     def set_target_position(self, target, shortest_path=True):
@@ -230,6 +299,7 @@ class Rotator(BaseModule):
         # should be done via check_state()
 
         # Update target variables
+        self._pending_target = None
         self.old_target_position = self.target_position
         self.target_position = target
         self.shortest_path = shortest_path
@@ -238,6 +308,8 @@ class Rotator(BaseModule):
         # target was updated but movement command is not yet sent.
         self.moving_to_target = False
 
+        self._wake.set()
+
 
     @rpc()
     @bind(exchange="rotator", routing_key="rpc.#", prefixed=True)
@@ -248,192 +320,222 @@ class Rotator(BaseModule):
 
         self.log.debug("Rotate_event: %s: %r", request_name, request_data)
 
-        if request_name == "rpc.tracking":
-            """
-                Set tracking to automatic/manual
-            """
+        # Unknown requests are ignored, as before the dispatch table
+        handler = self._rpc_table.get(request_name)
+        if handler is None:
+            return None
 
-            # Parse parameters
-            try:
-                mode = request_data['mode']
-            except (KeyError, ValueError):
-                raise RPCError("Invalid or missing mode parameter 'mode'")
+        return await handler(request_data)
+
+
+    async def _rpc_tracking(self, request_data):
+        """
+            Set tracking to automatic/manual
+        """
 
+        # Parse parameters
+        try:
+            mode = request_data['mode']
+        except (KeyError, ValueError):
+            raise RPCError("Invalid or missing mode parameter 'mode'")
+
+        self.target_valid = False  # ignore current target until new is received
+        self._pending_target = None
+
+        if mode == "automatic":
+            self.tracking_enabled = True
             self.target_valid = False  # ignore current target until new is received
+            self.log.info("Rotator is now in automatic mode")
 
-            if mode == "automatic":
-                self.tracking_enabled = True
-                self.target_valid = False  # ignore current target until new is received
-                self.log.info("Rotator is now in automatic mode")
+        elif mode == "manual":
+            self.tracking_enabled = False
+            self.target_valid = False  # ignore current target until new is received
 
-            elif mode == "manual":
-                self.tracking_enabled = False
-                self.target_valid = False  # ignore current target until new is received
+            try:
+                ########### Actual call of rotator command ###########
+                self.rotator.stop()
 
-                try:
-                    ########### Actual call of rotator command ###########
-                    self.rotator.stop()
+            except ControllerBoxError as e:
+                self.log.error(
+                    "Failed to stop rotator: %s", str(e), exc_info=True)
+                return
 
-                except ControllerBoxError as e:
-                    self.log.error(
-                        "Failed to stop rotator: %s", str(e), exc_info=True)
-                    return
+            self.log.info("Rotator is now in manual mode")
 
-                self.log.info("Rotator is now in manual mode")
+        else:
+            raise RPCError("Invalid mode %s" % mode)
 
-            else:
-                raise RPCError("Invalid mode %s" % mode)
+        # No valid target yet so only the new mode needs to be reported
+        await self._publish_status_now()
 
-            # Do immediate update for the rotator
-            await self.check_state()
 
-        elif request_name == "rpc.rotate":
-            """
-                Manual rotating
-            """
+    async def _rpc_rotate(self, request_data):
+        """
+            Manual rotating
+        """
 
-            target = (float(request_data['az']), float(request_data['el']))
+        target = (float(request_data['az']), float(request_data['el']))
 
-            # Disable automatic tracking
-            self.tracking_enabled = False
+        # Disable automatic tracking
+        self.tracking_enabled = False
 
-            try:
-                if "shortest" in request_data:
-                    self.set_target_position(target, request_data["shortest"])
+        try:
+            if "shortest" in request_data:
+                self.set_target_position(target, request_data["shortest"])
 
-                else:
-                    self.set_target_position(target)
+            else:
+                self.set_target_position(target)
 
-            except ControllerBoxError as e:
-                self.log.error(
-                    "Failed to update target position! %s",
-                    str(e), exc_info=True)
-                return
+        except ControllerBoxError as e:
+            self.log.error(
+                "Failed to update target position! %s",
+                str(e), exc_info=True)
+            return
 
-        elif request_name == "rpc.stop":
-            """
-                Rotator stop
-            """
-            # Stop tracking mode and
-            self.tracking_enabled = False
 
-            # Send stop command
-            self.rotator.stop()
+    async def _rpc_stop(self, request_data):
+        """
+            Rotator stop
+        """
+        # Stop tracking mode and
+        self.tracking_enabled = False
 
-        elif request_name == "rpc.calibrate":
-            """
-                Calibrate rotator position. IS BLOCKING.
-            """
-            # Stoping rotators
-            self.tracking_enabled = False
+        # Send stop command
+        self.rotator.stop()
+        self._wake.set()
 
-            ########### Actual call of rotator command ###########
-            self.rotator.stop()
-
-            # If no value is given, assume calibration shall not be changed
-            if "az" not in request_data:
-                request_data["az"] = 0
-
-            if "el" not in request_data:
-                request_data["el"] = 0
-
-            target = float(request_data['az']), float(request_data['el'])
-
-            now = time.strftime("%Y-%m-%dT%H:%M:%S%z", time.localtime())
-            msg = "{0}: Az: {1} El: {2}".format(now, target[0], target[1])
-
-            # Allow movement outside bounds by changing bounds if force is true
-            if "force" in request_data and request_data["force"]:
-                (az_min, az_max, el_min, el_max) = self.rotator.get_position_range()
-
-                if target[0] < az_min:
-                    az_min = target[0] - 1
-                    self.rotator.set_position_range(
-                        az_min, az_max, el_min, el_max)
-                elif target[0] > az_max:
-                    az_max = target[0] + 1
-                    self.rotator.set_position_range(
-                        az_min, az_max, el_min, el_max)
-
-                if target[1] < el_min:
-                    el_min = target[1] - 1
-                    self.rotator.set_position_range(
-                        az_min, az_max, el_min, el_max)
-                elif target[1] > el_max:
-                    el_max = target[1] + 1
-                    self.rotator.set_position_range(
-                        az_min, az_max, el_min, el_max)
-            else:
-                self.rotator.set_position_range(-90, 450, 0, 90)
 
-            # Necessary to set calibration flag otherwise only movement
-            if "cal" in request_data and request_data["cal"]:
-                self.log.info("Calibration attempted! " + msg)
-                pass
-            else:
-                self.log.info("Only moving, no calibration! " + msg)
-                self.set_target_position(target, False)
-                return
+    async def _rpc_calibrate(self, request_data):
+        """
+            Calibrate rotator position. IS BLOCKING.
+        """
+        # Stoping rotators
+        self.tracking_enabled = False
 
-            # Move to new origin and set to (0, 0)
-            ########### Actual call of rotator command ###########
-            ret = self.rotator.calibrate(target[0], target[1])
+        ########### Actual call of rotator command ###########
+        self.rotator.stop()
+
+        # If no value is given, assume calibration shall not be changed
+        if "az" not in request_data:
+            request_data["az"] = 0
+
+        if "el" not in request_data:
+            request_data["el"] = 0
+
+        target = float(request_data['az']), float(request_data['el'])
+
+        now = time.strftime("%Y-%m-%dT%H:%M:%S%z", time.localtime())
+        msg = "{0}: Az: {1} El: {2}".format(now, target[0], target[1])
+
+        # Allow movement outside bounds by changing bounds if force is true
+        if "force" in request_data and request_data["force"]:
+            (az_min, az_max, el_min, el_max) = self.rotator.get_position_range()
+
+            if target[0] < az_min:
+                az_min = target[0] - 1
+                self.rotator.set_position_range(
+                    az_min, az_max, el_min, el_max)
+            elif target[0] > az_max:
+                az_max = target[0] + 1
+                self.rotator.set_position_range(
+                    az_min, az_max, el_min, el_max)
+
+            if target[1] < el_min:
+                el_min = target[1] - 1
+                self.rotator.set_position_range(
+                    az_min, az_max, el_min, el_max)
+            elif target[1] > el_max:
+                el_max = target[1] + 1
+                self.rotator.set_position_range(
+                    az_min, az_max, el_min, el_max)
+        else:
+            self.rotator.set_position_range(-90, 450, 0, 90)
 
-            if ret != (0, 0):
-                self.rotator.set_position_range(-90, 450, 0, 90)
-                raise RuntimeError("Calibration unsuccessful!")
+        # Necessary to set calibration flag otherwise only movement
+        if "cal" in request_data and request_data["cal"]:
+            self.log.info("Calibration attempted! " + msg)
+            pass
+        else:
+            self.log.info("Only moving, no calibration! " + msg)
+            self.set_target_position(target, False)
+            return
+
+        # Move to new origin and set to (0, 0)
+        ########### Actual call of rotator command ###########
+        ret = self.rotator.calibrate(target[0], target[1])
 
-            # Reset limits of forced calib (TODO: remove hard coding of limits)
+        if ret != (0, 0):
             self.rotator.set_position_range(-90, 450, 0, 90)
+            raise RuntimeError("Calibration unsuccessful!")
 
-            with open("cal_history.txt", "a+") as history_file:
-                history_file.write(msg + "\n")
+        # Reset limits of forced calib (TODO: remove hard coding of limits)
+        self.rotator.set_position_range(-90, 450, 0, 90)
 
-            try:
-                self.set_target_position(ret)
-            except ControllerBoxError as e:
-                self.log.error(
-                    "Failed to update target position! %s",
-                    e.args[0], exc_info=True)
-                return
+        if self._cal_history is None:
+            # Line buffered so each entry reaches the disk
+            self._cal_history = open("cal_history.txt", "a", buffering=1)
+        self._cal_history.write(msg + "\n")
 
-            self.refresh_rotator_position(force_update=True)
-
-        elif request_name == "rpc.get_position_target":
-            ########### Actual call of rotator command ###########
-            ret = self.rotator.get_position_target()
-            return {"position_target": ret}
-
-        elif request_name == "rpc.get_position_range":
-            ########### Actual call of rotator command ###########
-            ret = self.rotator.get_position_range()
-            return {"position_range": ret}
-
-        elif request_name == "rpc.set_position_range":
-            ########### Actual call of rotator command ###########
-            ret = self.rotator.set_position_range(float(request_data["az_min"]),
-                                                  float(request_data["az_max"]),
-                                                  float(request_data["el_min"]),
-                                                  float(request_data["el_max"]))
-            return {"position_range": ret}
-
-        elif request_name == "rpc.get_dutycycle_range":
-            ########### Actual call of rotator command ###########
-            ret = self.rotator.get_dutycycle_range()
-            return {"dutycycle_range": ret}
-
-        elif request_name == "rpc.set_dutycycle_range":
-            ########### Actual call of rotator command ###########
-            self.rotator.set_dutycycle_range(int(request_data["az_min"]),
-                                             int(request_data["az_max"]),
-                                             int(request_data["el_min"]),
-                                             int(request_data["el_max"]))
-
-        elif request_name == "rpc.get_status":
-            """
-                Get rotator status message
-            """
-            return self.get_status_msg()
+        try:
+            self.set_target_position(ret)
+        except ControllerBoxError as e:
+            self.log.error(
+                "Failed to update target position! %s",
+                e.args[0], exc_info=True)
+            return
+
+        self.refresh_rotator_position(force_update=True)
+
+
+    async def _rpc_get_position_target(self, request_data):
+        ########### Actual call of rotator command ###########
+        ret = self.rotator.get_position_target()
+        return {"position_target": ret}
+
+
+    async def _rpc_get_position_range(self, request_data):
+        ########### Actual call of rotator command ###########
+        ret = self.rotator.get_position_range()
+        return {"position_range": ret}
+
+
+    async def _rpc_set_position_range(self, request_data):
+        ########### Actual call of rotator command ###########
+        ret = self.rotator.set_position_range(float(request_data["az_min"]),
+                                              float(request_data["az_max"]),
+                                              float(request_data["el_min"]),
+                                              float(request_data["el_max"]))
+        return {"position_range": ret}
+
+
+    async def _rpc_get_dutycycle_range(self, request_data):
+        ########### Actual call of rotator command ###########
+        ret = self.rotator.get_dutycycle_range()
+        return {"dutycycle_range": ret}
+
+
+    async def _rpc_set_dutycycle_range(self, request_data):
+        ########### Actual call of rotator command ###########
+        self.rotator.set_dutycycle_range(int(request_data["az_min"]),
+                                         int(request_data["az_max"]),
+                                         int(request_data["el_min"]),
+                                         int(request_data["el_max"]))
+
+
+    async def _rpc_get_status(self, request_data):
+        """
+            Get rotator status message
+        """
+        return self.get_status_msg()
+
+
+    @staticmethod
+    def _crosses_north(az_from, az_to):
+        """
+        Check whether a pass between the given azimuths in range [0, 360]
+        goes over the north from north-west to east or from north-east to west.
+        """
+        return (az_from > 270 and az_to < 180) or (0 < az_from < 90 and az_to > 180)
 
 
     @queue()
@@ -448,15 +550,20 @@ class Rotator(BaseModule):
         if not self.tracking_enabled:
             return
 
+        # Drop events not handled here before parsing the body
+        routing_key = message.delivery['routing_key']
+        if routing_key not in self.TRACKING_EVENTS:
+            return
+
         try:
-            event_body = json.loads(message.body)
+            event_body = json_loads(message.body)
         except ValueError as e:
             self.log.error('Failed to parse json: %s\n%s',
                            e.args[0], message.body)
             return
 
-        routing_key = message.delivery['routing_key']
-        self.log.debug("tracking_event: %s: %r", routing_key, event_body)
+        if self.log.isEnabledFor(logging.DEBUG):
+            self.log.debug("tracking_event: %s: %r", routing_key, event_body)
 
         if routing_key == "target.position":
             """
@@ -469,13 +576,9 @@ class Rotator(BaseModule):
             if new_target[1] < self.threshold:
                 new_target = (new_target[0], self.threshold)
 
-            try:
-                self.set_target_position(new_target, shortest_path=True)
-            except ControllerBoxError as e:
-                self.log.error(
-                    "Failed to update target position! %s",
-                    e.args[0], exc_info=True)
-                return
+            # Updates can arrive faster than the rotator can follow,
+            # so only the latest one is applied on the next periodic tick.
+            self._pending_target = new_target
 
         elif routing_key == "preaos":
             """
@@ -490,12 +593,7 @@ class Rotator(BaseModule):
             los_az = event_body["az_los"] % 360
 
             ### Might be needed to adapt this when using with different GS ###
-            # Over the north-west to east or vice versa or
-            # Over the north-east to west or vice versa
-            if (270 < aos_az < 360 and los_az < 180) or \
-                    (270 < los_az < 360 and aos_az < 180) or \
-                    (0 < aos_az < 90 and los_az > 180) or \
-                    (0 < los_az < 90 and aos_az > 180):
+            if self._crosses_north(aos_az, los_az) or self._crosses_north(los_az, aos_az):
                 # Check whether azimuth at max elevation is >180
                 if max_az > 180:
                     aos_az = (aos_az + 360 if aos_az < 90 else aos_az)
@@ -3,7 +3,11 @@
 import unittest
 import json
 import time
+import logging
+from types import SimpleNamespace
+from unittest import mock
 from porthouse.core.basemodule_async import BaseModule, RPCError, rpc, queue, bind, RPCRequestError
+from porthouse.gs.hardware.rotator import Rotator
 
 class RotatorTester(BaseModule):
     """
@@ -118,6 +122,51 @@ class TestRotator(unittest.TestCase):
         self.assertNotEqual(first["el"], last["el"])
 
 
+def _init_without_amqp(self, **kwargs):
+    """
+        BaseModule.__init__ replacement which doesn't connect to AMQP
+    """
+    self.log = logging.getLogger(self.__class__.__name__)
+
+
+def _tracking_message(routing_key, **kwargs):
+    """
+        Create a delivered message as received by tracking_event
+    """
+    return SimpleNamespace(delivery={"routing_key": routing_key},
+                           body=json.dumps(kwargs).encode())
+
+
+class TestRotatorTracking(unittest.IsolatedAsyncioTestCase):
+    """
+        Tracking logic tests run without AMQP broker
+    """
+
+    async def asyncSetUp(self):
+        # Skip the AMQP connection and the periodic state loop
+        with mock.patch.object(BaseModule, "__init__", _init_without_amqp), \
+                mock.patch.object(Rotator, "setup", mock.AsyncMock()):
+            self.rotator = Rotator(driver="dummy", address=None, tracking_enabled=True)
+        self.rotator.publish = mock.AsyncMock()
+
+    async def test_tracking_latest_wins(self):
+        set_position = mock.Mock(wraps=self.rotator.rotator.set_position)
+        self.rotator.rotator.set_position = set_position
+
+        # Burst of pointing updates between two ticks
+        for az in range(10, 60, 5):
+            self.rotator.tracking_event(
+                _tracking_message("target.position", az=az, el=45, velocity=213))
+
+        # Nothing is sent to the rotator before the next tick
+        set_position.assert_not_called()
+
+        # Only the latest target is applied on the next tick
+        await self.rotator.check_state()
+        set_position.assert_called_once_with(55.0, 45.0, shortest_path=True)
+        self.rotator.publish.assert_awaited_once()
+
+
 if __name__ == "__main__":
     unittest.main()
 
@@ -2,18 +2,105 @@
     Scheduler
 """
 
+import os
 import asyncio
+import hashlib
 import enum
-import json
 import yaml
 from datetime import datetime, timedelta
 import skyfield.api as skyfield
 
-from porthouse.core.config import cfg_path
+try:
+    # Faster event loop implementation, if installed
+    import uvloop
+    asyncio.set_event_loop_policy(uvloop.EventLoopPolicy())
+except ImportError:
+    pass
+
+try:
+    # Faster JSON (de)serialization, if installed
+    import orjson
+    json_loads = orjson.loads
+
+    def json_dumps(obj):
+        return orjson.dumps(obj, option=orjson.OPT_INDENT_2)
+except ImportError:
+    import json
+    json_loads = json.loads
+
+    def json_dumps(obj):
+        return json.dumps(obj, indent=2, ensure_ascii=False).encode()
+
+from porthouse.core.config import cfg_path, YamlLoader
 from porthouse.core.basemodule_async import BaseModule, RPCError, queue, rpc, bind
 from porthouse.gs.tracking.utils import *
 
 
+# Parsed JSON files: path -> (st_mtime_ns, st_size, content, digest of file data)
+_json_cache = {}
+
+
+def _get_json_cached(path):
+    """
+    Return the previously parsed content of a JSON file, or None
+    if the file has been modified since the last load.
+    """
+    st = os.stat(path)
+    cached = _json_cache.get(path)
+    if cached is not None and cached[:2] == (st.st_mtime_ns, st.st_size):
+        return cached[2]
+    return None
+
+
+def _load_json_cached(path):
+    """
+    Load a JSON file. The previously parsed content is returned
+    if the file has not been modified since the last load.
+    """
+    content = _get_json_cached(path)
+    if content is not None:
+        return content
+
+    st = os.stat(path)
+    with open(path, "rb") as fp:
+        data = fp.read()
+    content = json_loads(data)
+    _json_cache[path] = (st.st_mtime_ns, st.st_size, content, hashlib.blake2b(data).digest())
+    return content
+
+
+def _dump_json_cached(path, content):
+    """
+    Write a JSON file and remember the content as its parsed state
+    so that it does not need to be read back. The file is not rewritten
+    if its data would not change.
+    """
+    data = json_dumps(content)
+    digest = hashlib.blake2b(data).digest()
+
+    cached = _json_cache.get(path)
+    if cached is not None and cached[3] == digest:
+        try:
+            st = os.stat(path)
+        except FileNotFoundError:
+            st = None
+        if st is not None and cached[:2] == (st.st_mtime_ns, st.st_size):
+            _json_cache[path] = (st.st_mtime_ns, st.st_size, content, digest)
+            return
+
+    # Write to temporary file first so that a crash never leaves a partial file
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "wb") as fp:
+        fp.write(data)
+        # Make sure the data is on the disk before it replaces the old file
+        fp.flush()
+        os.fsync(fp.fileno())
+    os.replace(tmp_path, path)
+
+    st = os.stat(path)
+    _json_cache[path] = (st.st_mtime_ns, st.st_size, content, digest)
+
+
 class PassStatus(enum.Enum):
     """ Pass states """
     ERROR = -1
@@ -30,6 +117,9 @@ class Scheduler(BaseModule):
 
     PREAOS_PERIOD = 120  # [s]
     TIME_DELTA = 180  # [s]
+    MAX_CHECK_INTERVAL = 5  # [s] Upper bound for noticing external schedule edits
+    HISTORY_PERIOD = timedelta(hours=24)  # How long deleted passes are kept
+    WRITE_INTERVAL = 0.1  # [s] Schedule writes within this are coalesced
 
     def __init__(self, schedule_file="schedule.json", **kwarg):
         """
@@ -40,6 +130,16 @@ class Scheduler(BaseModule):
         self.gs: skyfield.Topos = None
         self.schedule = []
         self.schedule_file = schedule_file
+        # Schedule file content which self.schedule currently corresponds to
+        self._schedule_content = None
+        # Pending delayed schedule write
+        self._write_handle = None
+        # Schedule write in progress and whether another one was requested meanwhile
+        self._write_task = None
+        self._write_requested = False
+
+        # Set when the schedule is modified so that it is checked immediately
+        self._schedule_changed = asyncio.Event()
 
 
         loop = asyncio.get_event_loop()
@@ -50,7 +150,8 @@ class Scheduler(BaseModule):
         """
         """
 
-        tracker_cfg = yaml.load(open(cfg_path("groundstation.yaml"), "r"), Loader=yaml.Loader)
+        with open(cfg_path("groundstation.yaml"), "r") as fp:
+            tracker_cfg = yaml.load(fp, Loader=YamlLoader)
 
         self.gs_name = tracker_cfg["name"]
         self.gs = skyfield.Topos(
@@ -69,24 +170,36 @@ class Scheduler(BaseModule):
                 raise RuntimeError("No TLEs configured for %s", sat)
 
         self.schedule = []
-        self.read_schedule()
+        await self.read_schedule()
 
         while True:
-            self.check_schedule()
-            await asyncio.sleep(1)
+            delay = await self.check_schedule()
+
+            # Sleep until the next state change or until the schedule is modified
+            try:
+                await asyncio.wait_for(self._schedule_changed.wait(), timeout=delay)
+            except asyncio.TimeoutError:
+                pass
+            self._schedule_changed.clear()
 
 
 
-    def read_schedule(self):
+    async def read_schedule(self):
         """
-        Read schedule from json file
+        Read schedule from json file. A modified file is read in a worker
+        thread so that the event loop is not blocked by the disk I/O.
         """
 
         # Read schedule
         try:
-            with open(self.schedule_file, "r") as fp:
-                schedule = json.load(fp)
-                schedule = schedule["schedule"]
+            content = _get_json_cached(self.schedule_file)
+            if content is None:
+                content = await asyncio.get_event_loop().run_in_executor(
+                    None, _load_json_cached, self.schedule_file)
+            # Nothing has changed in the file since the last read or write
+            if content is self._schedule_content:
+                return
+            schedule = content["schedule"]
         except Exception as e:
             self.log.error("Failed to read ", exc_info=True)
             return
@@ -96,18 +209,21 @@ class Scheduler(BaseModule):
         for elem in schedule:
             schedule.append(Pass.from_dict(elem))
         self.schedule = schedule
+        self._schedule_content = content
 
 
-    def write_schedule(self):
+    async def write_schedule(self):
         """
-        Write schedule to JSON file
+        Write schedule to JSON file. The file is written in a worker thread
+        so that the event loop is not blocked by the disk I/O.
         """
 
         schedule = []
+        cutoff = datetime.utcnow() - self.HISTORY_PERIOD
         for entry in self.schedule:
 
             # Skip entries which are older than 24 hours
-            if (datetime.utcnow() - entry.los) > timedelta(hours=24):
+            if entry.los < cutoff:
                 if entry.status == PassStatus.DELETED:
                     continue
 
@@ -115,54 +231,129 @@ class Scheduler(BaseModule):
 
         # Save schedule to JSON file
         try:
-            with open(self.schedule_file, "w") as fp:
-                json.dump({"schedule": schedule}, fp, indent=4)
+            content = {"schedule": schedule}
+            await asyncio.get_event_loop().run_in_executor(
+                None, _dump_json_cached, self.schedule_file, content)
+            self._schedule_content = content
         except:
             self.log.error("Failed to write schedule file", exc_info=True)
 
 
-    def check_schedule(self):
+    def request_write(self):
+        """
+        Request the schedule to be written to the file. All the requests
+        made within WRITE_INTERVAL are served by a single write.
+        Only one write is in progress at a time.
+        """
+        if self._write_task is not None:
+            # Write again once the ongoing write has finished
+            self._write_requested = True
+            return
+
+        if self._write_handle is None:
+            self._write_handle = asyncio.get_event_loop().call_later(
+                self.WRITE_INTERVAL, self._flush_schedule)
+
+
+    def _flush_schedule(self):
+        """
+        Write the schedule requested by request_write.
+        """
+        self._write_handle = None
+        self._write_task = asyncio.ensure_future(self.write_schedule())
+        self._write_task.add_done_callback(self._write_done)
+
+
+    def _write_done(self, task):
+        """
+        Called when the schedule write has finished.
+        """
+        self._write_task = None
+        if self._write_requested:
+            self._write_requested = False
+            self.request_write()
+
+
+    async def check_schedule(self):
         """
         Checks schedule for passes.
+
+        Returns:
+            Seconds until the next pass changes its state
         """
 
-        self.read_schedule()
+        await self.read_schedule()
         now = datetime.utcnow().timestamp()
+        next_event = now + self.MAX_CHECK_INTERVAL
+
+        self.schedule.sort(key=lambda elem: elem.aos)
+        starting = []
 
         for elem in self.schedule:
+            preaos = elem.aos - self.PREAOS_PERIOD
+
             if now >= elem.los:
                 if elem.status != PassStatus.ERROR:
                     elem.status = PassStatus.DELETED
+                continue
 
-            elif now >= elem.aos - self.PREAOS_PERIOD:
-                if elem.gs != self.gs_name:
-                    continue
+            if now < preaos:
+                # Schedule is sorted by AOS so none of the remaining passes
+                # can have started or ended yet.
+                next_event = min(next_event, preaos)
+                break
+
+            next_event = min(next_event, elem.los)
 
-                if elem.status == PassStatus.SCHEDULED:
-                    self.start_pass(elem)
-                    elem.status = PassStatus.ONGOING
+            if elem.gs != self.gs_name:
+                continue
 
-        self.schedule = sorted(self.schedule, key = lambda elem: elem.aos)
+            if elem.status == PassStatus.SCHEDULED:
+                starting.append(elem)
+                elem.status = PassStatus.ONGOING
 
-        self.write_schedule()
+        # Publish all the starting passes concurrently
+        results = await asyncio.gather(
+            *(self.start_pass(elem) for elem in starting), return_exceptions=True)
+        for elem, result in zip(starting, results):
+            if isinstance(result, Exception):
+                self.log.error("Failed to start pass of %s: %s", elem.name, result)
+                elem.status = PassStatus.ERROR
 
+        self.request_write()
+        return next_event - now
 
-    def create_schedule(self):
+
+    async def create_schedule(self):
         """
         Create schedule from predicting passes.
         """
-        for sat in self.scheduled_sats:
-            passes = self.predict_passes(sat)
-            self.add_pass(passes)
+        # Fetch TLEs for all satellites concurrently, the prediction itself
+        # runs without yielding so the shared observer is not interleaved.
+        predictions = await asyncio.gather(
+            *(self.predict_passes(sat) for sat in self.scheduled_sats),
+            return_exceptions=True)
+
+        passes = []
+        for sat, sat_passes in zip(self.scheduled_sats, predictions):
+            if isinstance(sat_passes, Exception):
+                # Failing satellite must not prevent scheduling the others
+                self.log.error("Failed to predict passes for %s: %s", sat, sat_passes)
+                continue
+            if sat_passes:
+                passes.extend(sat_passes)
+
+        await self.add_pass(passes)
 
 
-    def get_schedule(self, name=None, period=None, unscheduled=False):
+    async def get_schedule(self, name=None, period=None, unscheduled=False):
         """
         Get schedule
         """
 
         schedule = []
-        self.read_schedule()
+        await self.read_schedule()
+        cutoff = datetime.utcnow() - timedelta(hours=1)
 
         for elem in self.schedule:
             if name is not None:
@@ -170,7 +361,7 @@ class Scheduler(BaseModule):
                     continue
 
             if period is not None:
-                if (datetime.utcnow() - elem.los) >= timedelta(hours=1):
+                if elem.los <= cutoff:
                     continue
 
             if unscheduled and elem.status != PassStatus.NOT_SCHEDULED:
@@ -195,7 +386,7 @@ class Scheduler(BaseModule):
         }, exchange="scheduler", routing_key="schedule.changed")
 
 
-    def add_pass(self, sc_passes):
+    async def add_pass(self, sc_passes):
         """
         Add list of passes to the schedule.
 
@@ -203,7 +394,7 @@ class Scheduler(BaseModule):
             passes: List of Pass objects to be added to schedule
         """
 
-        self.read_schedule()
+        await self.read_schedule()
         if isinstance(sc_passes, Pass):
             sc_passes = [sc_passes]
 
@@ -216,18 +407,19 @@ class Scheduler(BaseModule):
             if sc_pass.is_valid():
                 self.schedule.append(sc_pass)
 
-        self.write_schedule()
+        self.request_write()
+        self._schedule_changed.set()
         self.broadcast_changed_schedule()
 
 
-    def modify_pass_status(self, sc_pass):
+    async def modify_pass_status(self, sc_pass):
         """
         Modifies pass status that is in the schedule.
         """
         aos_search = sc_pass.aos - self.TIME_DELTA
         los_search = sc_pass.los + self.TIME_DELTA
 
-        self.read_schedule()
+        await self.read_schedule()
         for sd_pass in self.schedule:
             if sc_pass.name != sd_pass.name:
                 continue
@@ -238,7 +430,8 @@ class Scheduler(BaseModule):
             if sd_pass.aos >= aos_search and sd_pass.los <= los_search:
                 sd_pass.status = sc_pass.status
 
-        self.write_schedule()
+        self.request_write()
+        self._schedule_changed.set()
         self.broadcast_changed_schedule()
 
 
@@ -291,12 +484,12 @@ class Scheduler(BaseModule):
 
     @rpc()
     @bind("scheduler", "rpc.#")
-    def rpc_handler(self, request_name, request_data):
+    async def rpc_handler(self, request_name, request_data):
         """
             Parse command
         """
         if request_name == "rpc.get_schedule":
-            return self.get_schedule(**request_data)
+            return await self.get_schedule(**request_data)
 
         elif request_name == "rpc.add_pass":
             #
@@ -311,7 +504,7 @@ class Scheduler(BaseModule):
             if name in self.sat_list:
                 sc_pass = Pass(name, gs, aos, los)
                 sc_pass.status = PassStatus.SCHEDULED
-                self.add_pass(sc_pass)
+                await self.add_pass(sc_pass)
 
         elif request_name == "rpc.remove_pass":
             #
@@ -326,7 +519,7 @@ class Scheduler(BaseModule):
             if name in self.sat_list:
                 sc_pass = Pass(name, gs, PassStatus.DELETED, aos, los)
                 sc_pass.status = PassStatus.DELETED
-                self.modify_pass_status(sc_pass)
+                await self.modify_pass_status(sc_pass)
 
         elif request_name == "rpc.schedule_pass":
             #
@@ -340,7 +533,7 @@ class Scheduler(BaseModule):
 
             if name in self.sat_list:
                 sc_pass = Pass(name, gs, PassStatus.SCHEDULED, aos, los)
-                self.modify_pass_status(sc_pass)
+                await self.modify_pass_status(sc_pass)
 
         elif request_name == "rpc.unschedule_pass":
             name = request_data["name"]
@@ -350,7 +543,7 @@ class Scheduler(BaseModule):
 
             if name in self.sat_list:
                 sc_pass = Pass(name, gs, PassStatus.NOT_SCHEDULED, aos, los)
-                self.modify_pass_status(sc_pass)
+                await self.modify_pass_status(sc_pass)
 
         elif request_name == "rpc.get_sat_pass":
             #
@@ -360,7 +553,7 @@ class Scheduler(BaseModule):
             if "name" not in request_data:
                 raise RPCError("No satellite name given")
 
-            passes = self.predict_passes(**request_data)
+            passes = await self.predict_passes(**request_data)
             return [ elem.to_dict() for elem in passes ]
 
         raise RPCError("Unknown command")
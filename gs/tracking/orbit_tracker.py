@@ -11,7 +11,7 @@ from typing import Optional, NoReturn
 
 import skyfield
 
-from porthouse.core.config import cfg_path
+from porthouse.core.config import cfg_path, YamlLoader
 from porthouse.core.basemodule_async import BaseModule, RPCError, RPCRequestError, rpc, queue, bind
 
 from .utils import Satellite, Pass
@@ -43,7 +43,7 @@ class OrbitTracker(BaseModule):
 
         # Open config file
         with open(cfg_path("groundstation.yaml")) as f:
-            self.gs_config = yaml.load(f, Loader=yaml.Loader)['groundstation']
+            self.gs_config = yaml.load(f, Loader=YamlLoader)['groundstation']
 
         # Create observer from config file
         self.gs = skyfield.api.Topos(
@@ -10,7 +10,7 @@ import yaml
 import aiormq.abc
 from typing import Dict, List, NoReturn, Optional, Tuple, NamedTuple
 
-from porthouse.core.config import cfg_path
+from porthouse.core.config import cfg_path, YamlLoader
 from porthouse.core.frame import Frame
 from porthouse.core.basemodule_async import BaseModule, queue, bind
 
@@ -40,7 +40,8 @@ class PointTracker(BaseModule):
 
         if observer is None:
             # Parse observer information from tracker's configuration file
-            tracker_cfg = yaml.load(open(cfg_path("tracker.yaml"), "r"), Loader=yaml.Loader)
+            with open(cfg_path("tracker.yaml"), "r") as f:
+                tracker_cfg = yaml.load(f, Loader=YamlLoader)
             observer = tracker_cfg["observer"]
 
         self.observer = GPSPosition(observer["latitude"], observer["longitude"], observer.get("elevation", 0))
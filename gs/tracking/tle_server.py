@@ -29,7 +29,7 @@ from typing import Any, Dict, Optional, NoReturn
 import skyfield.api as skyfield
 import httpx
 
-from porthouse.core.config import cfg_path
+from porthouse.core.config import cfg_path, YamlLoader
 from porthouse.core.basemodule_async import BaseModule, RPCError, rpc, queue, bind
 
 
@@ -84,7 +84,8 @@ class TLEServer(BaseModule):
             pass
 
         # Parse TLE configuration file
-        tle_cfg = yaml.load(open(self.config_file, "r"), Loader=yaml.Loader)
+        with open(self.config_file, "r") as f:
+            tle_cfg = yaml.load(f, Loader=YamlLoader)
         self.update_interval: int = tle_cfg.get("update_interval", 12 * 3600) # seconds
 
         # Read space-track.org credentials from cfg file
@@ -204,7 +205,8 @@ class TLEServer(BaseModule):
 
         # Try to reload configuration file
         try:
-            tle_cfg = yaml.load(open(self.config_file, "r"), Loader=yaml.Loader)
+            with open(self.config_file, "r") as f:
+                tle_cfg = yaml.load(f, Loader=YamlLoader)
         except (yaml.parser.ParserError, FileNotFoundError):
             self.log.error("Failed to parse TLE configuration file!", exc_info=True)
             return
@@ -20,6 +20,12 @@ class Pass:
     Class to store and handle pass information
     """
 
+    __slots__ = (
+        "name", "gs", "status",
+        "t_aos", "az_aos", "t_max", "el_max", "az_max", "t_los", "az_los",
+        "orb_no",
+    )
+
     def __init__(self,
             sat_name: str,
             gs_name: str,